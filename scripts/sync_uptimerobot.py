@@ -4,17 +4,107 @@
 # Uses UPTIMEROBOT_API_KEY environment secret
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import csv
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from datetime import datetime, timezone
+from operator import attrgetter
+
+# UptimeRobot status and monitor type codes
+STATUS_MAP = {
+    0: 'PAUSED',
+    1: 'NOT_CHECKED_YET',
+    2: 'UP',
+    8: 'SEEMS_DOWN',
+    9: 'DOWN'
+}
+
+TYPE_MAP = {
+    1: 'HTTP(s)',
+    2: 'Keyword',
+    3: 'Ping',
+    4: 'Port',
+    5: 'Heartbeat'
+}
+
+@dataclass(slots=True)
+class MonitorRow:
+    """One processed monitor record; field order is the CSV column order"""
+    timestamp: str
+    monitor_id: int
+    friendly_name: str
+    url: str
+    type: str
+    status: str
+    uptime_percentage: float
+    response_time_ms: int
+    create_datetime: int
+    monitor_interval: int
+
+def _atomic_write_bytes(path, data):
+    """Write bytes to a temp file and rename it over path, so readers never see a partial file"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb', buffering=1 << 20) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_ndjson(path):
+    """Load records from a daily NDJSON file"""
+    with open(path, 'rb') as f:
+        return [orjson.loads(line) for line in f if line.strip()]
+
+def _uptime(m):
+    """Uptime percentage: 1-day ratio first (most recent), then all-time, then current status"""
+    # The API returns custom ratios as one string, e.g. "100.000-99.982-99.950"
+    r = m.get('custom_uptime_ratio') or m.get('custom_uptime_ratios')
+    if r:
+        return float(r.replace(',', '-').split('-', 1)[0]) if isinstance(r, str) else float(r[0])
+    a = m.get('all_time_uptime_ratio')
+    return float(a) if a else (100.0 if m.get('status') == 2 else 0.0)
+
+def _row(m, ts, interval, status_map=STATUS_MAP, type_map=TYPE_MAP):
+    """Build one processed row from a raw monitor; maps are bound as locals"""
+    get = m.get
+    
+    # Response time: latest sample first, then the monitor average
+    response_times = get('response_times')
+    response_time = response_times[-1].get('value', 0) if response_times else get('average_response_time', 0)
+    
+    return MonitorRow(
+        ts,
+        get('id'),
+        get('friendly_name', ''),
+        get('url', ''),
+        type_map.get(get('type'), 'Unknown'),
+        status_map.get(get('status'), 'UNKNOWN'),
+        round(_uptime(m), 2),
+        int(response_time) if response_time else 0,
+        get('create_datetime', ''),
+        interval
+    )
 
 class UptimeRobotSync:
+    # Column order for monitors.csv
+    FIELDNAMES = tuple(f.name for f in fields(MonitorRow))
+    
     def __init__(self, api_key):
         self.api_key = api_key
         self.base_url = 'https://api.uptimerobot.com/v2/'
         
+        # Reuse one pooled connection for all API calls in this sync
+        self.session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=None)
+        self.session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retries))
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        
     def ensure_directories(self):
         """Create necessary directories"""
         os.makedirs('data/uptimerobot', exist_ok=True)
@@ -28,10 +118,10 @@ class UptimeRobotSync:
                 'format': 'json'
             }
             
-            response = requests.post(url, data=data, timeout=30)
+            response = self.session.post(url, data=data, timeout=30)
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if result.get('stat') == 'ok':
                 return result.get('account', {})
@@ -43,7 +133,7 @@ class UptimeRobotSync:
         except requests.exceptions.RequestException as e:
             print(f"❌ Request error: {e}")
             return None
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"❌ JSON decode error: {e}")
             return None
     
@@ -54,19 +144,17 @@ class UptimeRobotSync:
             data = {
                 'api_key': self.api_key,
                 'format': 'json',
-                'logs': '1',
-                'log_limit': '10',
                 'response_times': '1',
-                'response_times_limit': '5',
+                'response_times_limit': '1',
                 'all_time_uptime_ratio': '1',
                 'custom_uptime_ratios': '1-7-30'
             }
             
             print("📡 Fetching monitors from UptimeRobot API...")
-            response = requests.post(url, data=data, timeout=60)
+            response = self.session.post(url, data=data, timeout=60)
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if result.get('stat') == 'ok':
                 monitors = result.get('monitors', [])
@@ -80,86 +168,31 @@ class UptimeRobotSync:
         except requests.exceptions.RequestException as e:
             print(f"❌ Request error: {e}")
             return []
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"❌ JSON decode error: {e}")
             return []
     
-    def get_status_text(self, status):
-        """Convert status code to text"""
-        status_map = {
-            0: 'PAUSED',
-            1: 'NOT_CHECKED_YET', 
-            2: 'UP',
-            8: 'SEEMS_DOWN',
-            9: 'DOWN'
-        }
-        return status_map.get(status, 'UNKNOWN')
-    
-    def get_monitor_type(self, type_code):
-        """Convert monitor type code to text"""
-        type_map = {
-            1: 'HTTP(s)',
-            2: 'Keyword',
-            3: 'Ping',
-            4: 'Port',
-            5: 'Heartbeat'
-        }
-        return type_map.get(type_code, 'Unknown')
-    
-    def get_response_time(self, monitor):
-        """Get the latest response time"""
-        # Try response_times array first
-        if monitor.get('response_times') and len(monitor['response_times']) > 0:
-            return monitor['response_times'][-1].get('value', 0)
-        
-        # Fallback to average_response_time
-        return monitor.get('average_response_time', 0)
-    
-    def get_uptime_percentage(self, monitor):
-        """Get uptime percentage (prefer recent data)"""
-        # Try 1-day ratio first (most recent)
-        if monitor.get('custom_uptime_ratios') and len(monitor['custom_uptime_ratios']) > 0:
-            return float(monitor['custom_uptime_ratios'][0])
-        
-        # Fallback to all-time ratio
-        if monitor.get('all_time_uptime_ratio'):
-            return float(monitor['all_time_uptime_ratio'])
-        
-        # Final fallback based on current status
-        return 100.0 if monitor.get('status') == 2 else 0.0
-    
-    def process_monitor_data(self, monitors, account_info):
+    def process_monitor_data(self, monitors, account_info, timestamp):
         """Process monitor data into standardized format"""
         processed_data = []
-        timestamp = datetime.now(timezone.utc).isoformat()
         
         print(f"📊 Processing {len(monitors)} monitors...")
         
+        interval = account_info.get('monitor_interval', 5)
+        append = processed_data.append
+        log_lines = []
+        
         for monitor in monitors:
-            # Get uptime percentage
-            uptime_percentage = self.get_uptime_percentage(monitor)
-            
-            # Get response time
-            response_time = self.get_response_time(monitor)
-            
-            processed_monitor = {
-                'timestamp': timestamp,
-                'monitor_id': monitor.get('id'),
-                'friendly_name': monitor.get('friendly_name', ''),
-                'url': monitor.get('url', ''),
-                'type': self.get_monitor_type(monitor.get('type')),
-                'status': self.get_status_text(monitor.get('status')),
-                'uptime_percentage': round(uptime_percentage, 2),
-                'response_time_ms': int(response_time) if response_time else 0,
-                'create_datetime': monitor.get('create_datetime', ''),
-                'monitor_interval': account_info.get('monitor_interval', 5)
-            }
-            
-            processed_data.append(processed_monitor)
+            processed_monitor = _row(monitor, timestamp, interval)
+            append(processed_monitor)
             
             # Status emoji for logging
-            status_emoji = "✅" if processed_monitor['status'] == 'UP' else "❌"
-            print(f"  {status_emoji} {processed_monitor['friendly_name']}: {processed_monitor['status']} ({processed_monitor['uptime_percentage']}% uptime)")
+            status_emoji = "✅" if processed_monitor.status == 'UP' else "❌"
+            log_lines.append(f"  {status_emoji} {processed_monitor.friendly_name}: {processed_monitor.status} ({processed_monitor.uptime_percentage}% uptime)")
+        
+        # One write to the runner log instead of one per monitor
+        if log_lines:
+            print('\n'.join(log_lines))
             
         return processed_data
     
@@ -168,52 +201,69 @@ class UptimeRobotSync:
         csv_file = 'data/uptimerobot/monitors.csv'
         file_exists = os.path.exists(csv_file)
         
-        fieldnames = [
-            'timestamp', 'monitor_id', 'friendly_name', 'url', 'type', 
-            'status', 'uptime_percentage', 'response_time_ms', 
-            'create_datetime', 'monitor_interval'
-        ]
+        fieldnames = self.FIELDNAMES
         
-        with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+        # Build rows in fieldname order so they can go out in one writerows call
+        row_values = attrgetter(*fieldnames)
+        rows = [row_values(r) for r in data]
+        
+        with open(csv_file, 'a', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            writer = csv.writer(f)
             
             if not file_exists:
-                writer.writeheader()
+                writer.writerow(fieldnames)
             
-            for row in data:
-                writer.writerow(row)
+            writer.writerows(rows)
         
         print(f"💾 Saved data to {csv_file}")
     
-    def save_to_json(self, data):
-        """Save processed data to daily JSON file"""
-        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-        json_file = f'data/uptimerobot/{today}.json'
+    def save_to_json(self, data, today):
+        """Append processed data to daily NDJSON file (one record per line)"""
+        json_file = f'data/uptimerobot/{today}.ndjson'
         
-        # Load existing data for today
-        if os.path.exists(json_file):
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                existing_data = []
-        else:
-            existing_data = []
+        # Append only this run's records - no need to reparse the day so far
+        # A single fsynced write so the batch is never left half on disk
+        with open(json_file, 'ab', buffering=1 << 20) as f:
+            f.write(b''.join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in data))
+            f.flush()
+            os.fsync(f.fileno())
         
-        # Add new data
-        existing_data.extend(data)
+        print(f"💾 Saved daily data to {json_file}")
+    
+    def tally_monitors(self, data):
+        """Count statuses and sum uptime/response time in a single pass"""
+        up = down = paused = 0
+        uptime_sum = 0.0
+        response_sum = response_count = 0
         
-        # Save updated data
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, indent=2, ensure_ascii=False)
+        for m in data:
+            status = m.status
+            uptime_sum += m.uptime_percentage
+            
+            if status == 'UP':
+                up += 1
+                if m.response_time_ms > 0:
+                    response_sum += m.response_time_ms
+                    response_count += 1
+            elif status in ('DOWN', 'SEEMS_DOWN'):
+                down += 1
+            elif status == 'PAUSED':
+                paused += 1
         
-        print(f"💾 Saved daily data to {json_file}")
+        return {
+            'up': up,
+            'down': down,
+            'paused': paused,
+            'uptime_sum': uptime_sum,
+            'response_sum': response_sum,
+            'response_count': response_count
+        }
     
-    def create_summary_json(self, data):
+    def create_summary_json(self, data, last_updated):
         """Create summary JSON for dashboard consumption"""
         if not data:
             summary = {
-                'last_updated': datetime.now(timezone.utc).isoformat(),
+                'last_updated': last_updated,
                 'total_monitors': 0,
                 'monitors_up': 0,
                 'monitors_down': 0,
@@ -222,40 +272,46 @@ class UptimeRobotSync:
                 'monitors': []
             }
         else:
-            monitors_up = len([m for m in data if m['status'] == 'UP'])
-            monitors_down = len([m for m in data if m['status'] in ['DOWN', 'SEEMS_DOWN', 'PAUSED']])
-            avg_uptime = sum(m['uptime_percentage'] for m in data) / len(data)
+            totals = self.tally_monitors(data)
+            avg_uptime = totals['uptime_sum'] / len(data)
             
-            # Calculate average response time for UP monitors only
-            up_monitors = [m for m in data if m['status'] == 'UP' and m['response_time_ms'] > 0]
-            avg_response = sum(m['response_time_ms'] for m in up_monitors) / len(up_monitors) if up_monitors else 0
+            # Average response time counts UP monitors only
+            avg_response = totals['response_sum'] / totals['response_count'] if totals['response_count'] else 0
             
             summary = {
-                'last_updated': datetime.now(timezone.utc).isoformat(),
+                'last_updated': last_updated,
                 'total_monitors': len(data),
-                'monitors_up': monitors_up,
-                'monitors_down': monitors_down,
+                'monitors_up': totals['up'],
+                'monitors_down': totals['down'] + totals['paused'],
                 'average_uptime': round(avg_uptime, 2),
                 'average_response_time': round(avg_response, 2),
                 'monitors': data
             }
         
-        with open('data/uptimerobot/summary.json', 'w', encoding='utf-8') as f:
-            json.dump(summary, f, indent=2, ensure_ascii=False)
+        _atomic_write_bytes('data/uptimerobot/summary.json', orjson.dumps(summary, option=orjson.OPT_INDENT_2))
         
         print(f"💾 Created summary.json for dashboard")
     
     def sync_data(self):
         """Main sync function"""
         print("🚀 Starting UptimeRobot sync...")
-        print(f"⏰ Time: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        # One clock read per sync, shared by every row and output file
+        run_ts = datetime.now(timezone.utc)
+        run_ts_iso = run_ts.isoformat()
+        
+        print(f"⏰ Time: {run_ts.strftime('%Y-%m-%d %H:%M:%S UTC')}")
         print(f"🔑 API Key: {self.api_key[:10]}...")
         
         self.ensure_directories()
         
-        # Verify API key
+        # Verify API key and fetch monitors concurrently - the calls are independent
         print("\n🔐 Verifying API key...")
-        account_info = self.fetch_account_details()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            account_future = executor.submit(self.fetch_account_details)
+            monitors_future = executor.submit(self.fetch_monitors)
+            account_info = account_future.result()
+            monitors = monitors_future.result()
+        
         if not account_info:
             print("❌ Failed to verify API key")
             return False
@@ -265,32 +321,24 @@ class UptimeRobotSync:
         print(f"📊 Monitor limit: {account_info.get('monitor_limit', 'Unknown')}")
         print(f"⏱️  Check interval: {account_info.get('monitor_interval', 'Unknown')} minutes")
         
-        # Small delay to respect rate limits
-        time.sleep(2)
-        
-        # Fetch monitors
-        monitors = self.fetch_monitors()
-        
         if not monitors:
             print("⚠️  No monitors found. Creating empty summary.")
-            self.create_summary_json([])
+            self.create_summary_json([], run_ts_iso)
             return True
         
         # Process and save data
-        processed_data = self.process_monitor_data(monitors, account_info)
+        processed_data = self.process_monitor_data(monitors, account_info, run_ts_iso)
         
         print(f"\n💾 Saving data...")
         self.save_to_csv(processed_data)
-        self.save_to_json(processed_data)
-        self.create_summary_json(processed_data)
+        self.save_to_json(processed_data, run_ts.strftime('%Y-%m-%d'))
+        self.create_summary_json(processed_data, run_ts_iso)
         
         # Final summary
-        up_count = len([m for m in processed_data if m['status'] == 'UP'])
-        down_count = len([m for m in processed_data if m['status'] in ['DOWN', 'SEEMS_DOWN']])
-        paused_count = len([m for m in processed_data if m['status'] == 'PAUSED'])
+        totals = self.tally_monitors(processed_data)
         
         print(f"\n✅ Sync complete!")
-        print(f"📈 Summary: {up_count} UP | {down_count} DOWN | {paused_count} PAUSED")
+        print(f"📈 Summary: {totals['up']} UP | {totals['down']} DOWN | {totals['paused']} PAUSED")
         print(f"📁 Files updated in data/uptimerobot/")
         
         return True